@@ -21,7 +21,7 @@
 Configuration file (aka ``ssh_config``) support.
 """
 
-import fnmatch
+import copy
 import getpass
 import os
 import re
@@ -42,6 +42,75 @@ from .ssh_exception import CouldNotCanonicalize, ConfigParseError
 
 SSH_PORT = 22
 
+# Characters separating host tokens; same as shlex (and OpenSSH), which do not
+# consider eg form feeds or non-breaking spaces to be whitespace.
+_HOST_WHITESPACE = " \t\r\n"
+
+# A run of host-list characters: a double- or single-quoted string (sans
+# quotes), or unquoted, non-whitespace characters. Adjacent runs form one
+# host token, eg 'foo"bar"' is the token foobar.
+_HOST_TOKEN_RE = re.compile(r"\"([^\"]*)\"|'([^']*)'|([^ \t\r\n\"'\\]+)")
+
+# A whole host token, for host lists with no quoting in them at all.
+_HOST_WORD_RE = re.compile(r"[^ \t\r\n]+")
+
+# Canonical (ssh_config man page) and all-lowercase spellings of commonly used
+# keywords, mapped to the lowercase form used as keys throughout. Anything not
+# listed here is simply lowercased at parse time.
+_KEYWORDS = {}
+for _keyword in (
+    "AddressFamily",
+    "BatchMode",
+    "BindAddress",
+    "CanonicalDomains",
+    "CanonicalizeFallbackLocal",
+    "CanonicalizeHostname",
+    "CanonicalizeMaxDots",
+    "CheckHostIP",
+    "Ciphers",
+    "Compression",
+    "ConnectTimeout",
+    "ControlMaster",
+    "ControlPath",
+    "ControlPersist",
+    "DynamicForward",
+    "ForwardAgent",
+    "ForwardX11",
+    "GSSAPIAuthentication",
+    "GSSAPIDelegateCredentials",
+    "Host",
+    "HostKeyAlgorithms",
+    "HostName",
+    "IdentitiesOnly",
+    "IdentityFile",
+    "KexAlgorithms",
+    "LocalForward",
+    "LogLevel",
+    "MACs",
+    "Match",
+    "PasswordAuthentication",
+    "Port",
+    "PreferredAuthentications",
+    "ProxyCommand",
+    "ProxyJump",
+    "PubkeyAuthentication",
+    "RemoteForward",
+    "ServerAliveCountMax",
+    "ServerAliveInterval",
+    "StrictHostKeyChecking",
+    "User",
+    "UserKnownHostsFile",
+):
+    _KEYWORDS[_keyword] = _KEYWORDS[_keyword.lower()] = _keyword.lower()
+del _keyword
+
+# Local home directory, for the ~ and %d tokens. Resolved once, since it can
+# otherwise mean a getpwuid() call per tokenized value.
+_HOME = os.path.expanduser("~")
+
+# Kinds of host pattern, as determined by _classify_pattern().
+_EXACT, _PREFIX, _SUFFIX, _INFIX, _GLOB = range(5)
+
 
 class SSHConfig(object):
     """
@@ -68,6 +137,9 @@ class SSHConfig(object):
         "match-exec": ["%d", "%h", "%L", "%l", "%n", "%p", "%r", "%u"],
     }
 
+    # Upper bound on how many distinct hostnames' lookup results are kept.
+    _LOOKUP_CACHE_SIZE = 1024
+
     def __init__(self):
         """
         Create a new OpenSSH config object.
@@ -88,6 +160,13 @@ class SSHConfig(object):
             config = SSHConfig.from_text("Host foo\\n\\tUser bar")
         """
         self._config = []
+        # Derived from _config by parse(); see there.
+        self._matchers = []
+        self._configs = []
+        self._exact_index = {}
+        self._has_matches = False
+        self._hostnames = frozenset()
+        self._lookup_cache = {}
 
     @classmethod
     def from_text(cls, text):
@@ -128,7 +207,11 @@ class SSHConfig(object):
         # Start out w/ implicit/anonymous global host-like block to hold
         # anything not contained by an explicit one.
         context = {"host": ["*"], "config": {}}
-        for line in file_obj:
+        # Read everything in one go; config files are small, and this avoids
+        # per-line readline() overhead from the file object. Only split on
+        # newlines proper (str.splitlines() also breaks at eg form feeds),
+        # leaving any trailing \r to the strip() below.
+        for line in file_obj.read().split("\n"):
             # Strip any leading or trailing whitespace from the line.
             # Refer to https://github.com/paramiko/paramiko/issues/499
             line = line.strip()
@@ -137,10 +220,11 @@ class SSHConfig(object):
                 continue
 
             # Parse line into key, value
-            match = re.match(self.SETTINGS_REGEX, line)
+            match = self.SETTINGS_REGEX.match(line)
             if not match:
                 raise ConfigParseError("Unparsable line {}".format(line))
-            key = match.group(1).lower()
+            key = match.group(1)
+            key = _KEYWORDS.get(key) or key.lower()
             value = match.group(2)
 
             # Host keyword triggers switch to new block/context
@@ -177,8 +261,42 @@ class SSHConfig(object):
                         context["config"][key] = [value]
                 elif key not in context["config"]:
                     context["config"][key] = value
-        # Store last 'open' block and we're done
+        # Store last 'open' block
         self._config.append(context)
+        # Split out what lookups need into parallel lists: _matchers holds
+        # only what decides whether a block applies, as an (index, patterns,
+        # matches) tuple per block, and _configs the block's settings (shared
+        # with _config), which are only touched once a block is known to
+        # apply. Host blocks without any settings (eg the implicit leading
+        # 'Host *') can't affect a lookup and get no matcher at all.
+        # Host patterns are classified up front so lookups needn't redo it.
+        # Like OpenSSH, hostnames are matched case-insensitively, so patterns
+        # are lowercased here once and lookups lowercase their hostname once.
+        self._matchers = []
+        self._configs = []
+        # Blocks made up solely of literal hostnames are instead found via a
+        # hostname -> block indices mapping (their patterns are None).
+        self._exact_index = {}
+        self._has_matches = False
+        for index, entry in enumerate(self._config):
+            self._configs.append(entry["config"])
+            if "matches" in entry:
+                self._has_matches = True
+                self._matchers.append((index, (), entry["matches"]))
+                continue
+            if not entry["config"]:
+                continue
+            patterns = _classify_patterns(x.lower() for x in entry["host"])
+            if patterns and all(x[0] == _EXACT and not x[2] for x in patterns):
+                for pattern in patterns:
+                    self._exact_index.setdefault(pattern[1], set()).add(index)
+                patterns = None
+            self._matchers.append((index, patterns, None))
+        self._hostnames = frozenset(
+            host for entry in self._config for host in entry.get("host", [])
+        )
+        # Any previously cached lookups may no longer be accurate
+        self._lookup_cache = {}
 
     def lookup(self, hostname):
         """
@@ -210,6 +328,14 @@ class SSHConfig(object):
             set to the being-looked-up hostname, which is as close as we can
             get to OpenSSH's behavior around that particular option.
 
+        .. note::
+            For configs without any ``Match`` blocks, results are cached per
+            hostname until the next call to `parse`. This includes token
+            values drawn from the local system, such as the local username
+            (``%u``, and ``%r`` when no ``User`` is set), local hostname
+            (``%L``) and FQDN (``%l``), which are not re-read on later lookups
+            of the same hostname.
+
         :param str hostname: the hostname to lookup
 
         .. versionchanged:: 2.5
@@ -219,6 +345,11 @@ class SSHConfig(object):
         .. versionchanged:: 2.7
             Added ``Match`` support.
         """
+        cached = self._lookup_cache.get(hostname)
+        if cached is not None:
+            # Hand out copies so callers mutating eg identityfile lists can't
+            # alter what later lookups see.
+            return copy.deepcopy(cached)
         # First pass
         options = self._lookup(hostname=hostname)
         # Inject HostName if it was not set (this used to be done incidentally
@@ -236,33 +367,48 @@ class SSHConfig(object):
             # Overwrite HostName again here (this is also what OpenSSH does)
             options["hostname"] = hostname
             options = self._lookup(hostname, options, canonical=True)
+        # Don't cache when Match blocks or canonicalization are involved, as
+        # which settings apply then hinges on the local user, DNS, subprocesses
+        # etc. (Token values drawn from the local system do get cached; see
+        # docstring.)
+        if (
+            not canon
+            and not self._has_matches
+            and len(self._lookup_cache) < self._LOOKUP_CACHE_SIZE
+        ):
+            self._lookup_cache[hostname] = copy.deepcopy(options)
         return options
 
     def _lookup(self, hostname, options=None, canonical=False):
         # Init
         if options is None:
             options = SSHConfigDict()
+        target = hostname.lower()
+        # Which literal-hostname-only blocks apply is a single dict lookup
+        exact_matches = self._exact_index.get(target, ())
         # Iterate all stanzas, applying any that match, in turn (so that things
         # like Match can reference currently understood state)
-        for context in self._config:
-            if not (
-                self._pattern_matches(context.get("host", []), hostname)
-                or self._does_match(
-                    context.get("matches", []), hostname, canonical, options
-                )
-            ):
+        for index, patterns, matches in self._matchers:
+            if patterns is None:
+                if index not in exact_matches:
+                    continue
+            elif matches is not None:
+                if not self._does_match(matches, hostname, canonical, options):
+                    continue
+            elif not self._classified_matches(patterns, target):
                 continue
-            for key, value in context["config"].items():
+            for key, value in self._configs[index].items():
                 if key not in options:
-                    # Create a copy of the original value,
-                    # else it will reference the original list
-                    # in self._config and update that value too
-                    # when the extend() is being called.
-                    options[key] = value[:] if value is not None else value
+                    # NOTE: list values are shared with self._config; they
+                    # are only ever replaced, never mutated in place (see
+                    # below, and _expand_variables).
+                    options[key] = value
                 elif key == "identityfile":
-                    options[key].extend(
-                        x for x in value if x not in options[key]
-                    )
+                    # Extend a copy, checking against it as it grows so that
+                    # repeats within this block are dropped too.
+                    merged = list(options[key])
+                    merged.extend(x for x in value if x not in merged)
+                    options[key] = merged
         # Expand variables in resulting values (besides 'Match exec' which was
         # already handled above)
         options = self._expand_variables(options, hostname)
@@ -317,27 +463,23 @@ class SSHConfig(object):
         Return the set of literal hostnames defined in the SSH config (both
         explicit hostnames and wildcard entries).
         """
-        hosts = set()
-        for entry in self._config:
-            hosts.update(entry["host"])
-        return hosts
+        # Copied so callers are free to modify what they get back
+        return set(self._hostnames)
 
     def _pattern_matches(self, patterns, target):
         # Convenience auto-splitter if not already a list
         if hasattr(patterns, "split"):
             patterns = patterns.split(",")
-        match = False
+        return self._classified_matches(_classify_patterns(patterns), target)
+
+    def _classified_matches(self, patterns, target):
+        # NOTE: relies on _classify_patterns() ordering negated patterns first
         for pattern in patterns:
-            # Short-circuit if target matches a negated pattern
-            if pattern.startswith("!") and fnmatch.fnmatch(
-                target, pattern[1:]
-            ):
-                return False
-            # Flag a match, but continue (in case of later negation) if regular
-            # match occurs
-            elif fnmatch.fnmatch(target, pattern):
-                match = True
-        return match
+            if _match_pattern(pattern, target):
+                # Any negated match means no match, while a regular match is
+                # final once all the negated ones are out of the way.
+                return not pattern[2]
+        return False
 
     # TODO 3.0: remove entirely (is now unused internally)
     def _allowed(self, hosts, hostname):
@@ -369,9 +511,11 @@ class SSHConfig(object):
             # short-circuiting only on fail
             elif type_ == "host":
                 hostval = configured_host or target_hostname
-                passed = self._pattern_matches(param, hostval)
+                passed = self._pattern_matches(param.lower(), hostval.lower())
             elif type_ == "originalhost":
-                passed = self._pattern_matches(param, target_hostname)
+                passed = self._pattern_matches(
+                    param.lower(), target_hostname.lower()
+                )
             elif type_ == "user":
                 user = configured_user or local_username
                 passed = self._pattern_matches(param, user)
@@ -410,52 +554,19 @@ class SSHConfig(object):
         :returns: The tokenized version of the input ``value`` string.
         """
         allowed_tokens = self._allowed_tokens(key)
-        # Short-circuit if no tokenization possible
-        if not allowed_tokens:
+        # Short-circuit if no tokenization possible, including the (common)
+        # case of a value with no tokens in it at all
+        if not allowed_tokens or ("%" not in value and "~" not in value):
             return value
-        # Obtain potentially configured hostname, for use with %h.
-        # Special-case where we are tokenizing the hostname itself, to avoid
-        # replacing %h with a %h-bearing value, etc.
-        configured_hostname = target_hostname
-        if key != "hostname":
-            configured_hostname = config.get("hostname", configured_hostname)
-        # Ditto the rest of the source values
-        if "port" in config:
-            port = config["port"]
-        else:
-            port = SSH_PORT
-        user = getpass.getuser()
-        if "user" in config:
-            remoteuser = config["user"]
-        else:
-            remoteuser = user
-        local_hostname = socket.gethostname().split(".")[0]
-        local_fqdn = LazyFqdn(config, local_hostname)
-        homedir = os.path.expanduser("~")
-        # The actual tokens!
-        replacements = {
-            # TODO: %%???
-            # TODO: %C?
-            "%d": homedir,
-            "%h": configured_hostname,
-            # TODO: %i?
-            "%L": local_hostname,
-            "%l": local_fqdn,
-            # also this is pseudo buggy when not in Match exec mode so document
-            # that. also WHY is that the case?? don't we do all of this late?
-            "%n": target_hostname,
-            "%p": port,
-            "%r": remoteuser,
-            # TODO: %T? don't believe this is possible however
-            "%u": user,
-            "~": homedir,
-        }
+        # Token values are only computed if the value actually contains the
+        # token, as some need a syscall or even a DNS lookup (%l).
+        replacements = _TokenValues(config, target_hostname, key)
         # Do the thing with the stuff
         tokenized = value
-        for find, replace in replacements.items():
-            if find not in allowed_tokens:
+        for find in _TOKENS:
+            if find not in allowed_tokens or find not in tokenized:
                 continue
-            tokenized = tokenized.replace(find, str(replace))
+            tokenized = tokenized.replace(find, replacements[find])
         # TODO: log? eg that value -> tokenized
         return tokenized
 
@@ -485,8 +596,8 @@ class SSHConfig(object):
                 continue
             tokenizer = partial(self._tokenize, config, target_hostname, k)
             if isinstance(config[k], list):
-                for i, value in enumerate(config[k]):
-                    config[k][i] = tokenizer(value)
+                # Build a new list; the old one may belong to self._config.
+                config[k] = [tokenizer(x) for x in config[k]]
             else:
                 config[k] = tokenizer(config[k])
         return config
@@ -495,10 +606,32 @@ class SSHConfig(object):
         """
         Return a list of host_names from host value.
         """
-        try:
-            return shlex.split(host)
-        except ValueError:
-            raise ConfigParseError("Unparsable host {}".format(host))
+        # Most Host lines involve no quoting at all
+        if not any(x in host for x in "\"'\\"):
+            return _HOST_WORD_RE.findall(host)
+        # Backslash escapes are rare enough to leave to shlex.
+        if "\\" in host:
+            try:
+                return shlex.split(host)
+            except ValueError:
+                raise ConfigParseError("Unparsable host {}".format(host))
+        hosts = []
+        position = 0
+        for match in _HOST_TOKEN_RE.finditer(host):
+            gap = host[position : match.start()]
+            # Anything skipped over besides whitespace is an unbalanced quote
+            if gap.strip(_HOST_WHITESPACE):
+                break
+            chunk = next(x for x in match.groups() if x is not None)
+            if gap or not hosts:
+                hosts.append(chunk)
+            else:
+                hosts[-1] += chunk
+            position = match.end()
+        else:
+            if not host[position:].strip(_HOST_WHITESPACE):
+                return hosts
+        raise ConfigParseError("Unparsable host {}".format(host))
 
     def _get_matches(self, match):
         """
@@ -545,6 +678,111 @@ class SSHConfig(object):
         return matches
 
 
+def _classify_patterns(patterns):
+    """
+    Classify each of ``patterns`` via `_classify_pattern`, negated ones first.
+
+    A single negated match vetoes the whole list, so checking those first
+    lets matching stop at the first regular match instead of having to look
+    at every pattern.
+    """
+    classified = [_classify_pattern(x) for x in patterns]
+    return [x for x in classified if x[2]] + [
+        x for x in classified if not x[2]
+    ]
+
+
+def _classify_pattern(pattern):
+    """
+    Classify a single host pattern (e.g. ``*.example.com`` or ``!foo*``).
+
+    Most real-world patterns are either literal hostnames or have a single
+    leading and/or trailing ``*``; those are answered with plain string
+    comparisons. Anything else is left to `_wildmatch`.
+
+    :returns:
+        A ``(kind, literal, negate, min_len)`` tuple, where ``kind`` is one
+        of the module-level ``_EXACT``/``_PREFIX``/``_SUFFIX``/``_INFIX``/
+        ``_GLOB`` constants; ``literal`` is the pattern with any negation and
+        outer wildcards removed (or the full, non-negated pattern for
+        ``_GLOB``); ``negate`` is a boolean; and ``min_len`` is the shortest
+        length a matching target could have.
+    """
+    negate = pattern.startswith("!")
+    if negate:
+        pattern = pattern[1:]
+    head, tail = pattern.startswith("*"), pattern.endswith("*")
+    literal = pattern[head : len(pattern) - tail if tail else None]
+    # Every character but '*' consumes exactly one character of the target.
+    min_len = len(pattern) - pattern.count("*")
+    if "*" in literal or "?" in literal:
+        return _GLOB, pattern, negate, min_len
+    if head and tail:
+        kind = _INFIX
+    elif head:
+        kind = _SUFFIX
+    elif tail:
+        kind = _PREFIX
+    else:
+        kind = _EXACT
+    return kind, literal, negate, min_len
+
+
+def _match_pattern(pattern, target):
+    """
+    Test ``target`` against a ``pattern`` tuple from `_classify_pattern`.
+
+    Negation is not applied here; callers decide what a hit means.
+    """
+    kind, literal = pattern[0], pattern[1]
+    if kind == _EXACT:
+        return target == literal
+    if kind == _PREFIX:
+        return target.startswith(literal)
+    if kind == _SUFFIX:
+        return target.endswith(literal)
+    if kind == _INFIX:
+        return literal in target
+    # Cheap length check before walking the whole pattern
+    if len(target) < pattern[3]:
+        return False
+    return _wildmatch(literal, target)
+
+
+def _wildmatch(pattern, target):
+    """
+    Return whether ``target`` matches the wildcard ``pattern``.
+
+    Only ``*`` (any run of characters) and ``?`` (any single character) are
+    special, same as OpenSSH's ``match_pattern``; unlike `fnmatch`, bracket
+    expressions are not supported and ``[`` is just another character.
+
+    Runs in linear time for all practical purposes: on a mismatch we only
+    ever backtrack to just after the most recent ``*``.
+    """
+    p, t = 0, 0
+    p_len, t_len = len(pattern), len(target)
+    # Position of the last '*' seen, and of the target char it's matched up to
+    star, mark = -1, 0
+    while t < t_len:
+        if p < p_len and pattern[p] == "*":
+            star, mark = p, t
+            p += 1
+        elif p < p_len and pattern[p] in ("?", target[t]):
+            p += 1
+            t += 1
+        elif star != -1:
+            # Let the last '*' swallow one more character and try again
+            mark += 1
+            p, t = star + 1, mark
+        else:
+            return False
+    # Any trailing '*'s can match the empty string
+    while p < p_len and pattern[p] == "*":
+        p += 1
+    return p == p_len
+
+
 def _addressfamily_host_lookup(hostname, options):
     """
     Try looking up ``hostname`` in an IPv4 or IPv6 specific manner.
@@ -582,6 +820,61 @@ def _addressfamily_host_lookup(hostname, options):
         pass
 
 
+# All tokens we know how to expand, in the order they are expanded.
+# TODO: %%???
+# TODO: %C?
+# TODO: %i?
+# TODO: %T? don't believe this is possible however
+_TOKENS = ("%d", "%h", "%L", "%l", "%n", "%p", "%r", "%u", "~")
+
+
+class _TokenValues(dict):
+    """
+    Mapping of token (eg ``"%h"``) to its string value for `SSHConfig`'s
+    token expansion, computing (and remembering) each value on first access.
+
+    :param config: Current config data.
+    :param target_hostname: Original target connection hostname.
+    :param key: Config key being tokenized.
+    """
+
+    def __init__(self, config, target_hostname, key):
+        super(_TokenValues, self).__init__()
+        self.config = config
+        self.target_hostname = target_hostname
+        self.key = key
+
+    def __missing__(self, token):
+        config = self.config
+        if token in ("%d", "~"):
+            value = _HOME
+        elif token == "%h":
+            # Obtain potentially configured hostname. Special-case where we
+            # are tokenizing the hostname itself, to avoid replacing %h with a
+            # %h-bearing value, etc.
+            value = self.target_hostname
+            if self.key != "hostname":
+                value = config.get("hostname", value)
+        elif token == "%L":
+            value = socket.gethostname().split(".")[0]
+        elif token == "%l":
+            value = LazyFqdn(config, self["%L"])
+        elif token == "%n":
+            # also this is pseudo buggy when not in Match exec mode so document
+            # that. also WHY is that the case?? don't we do all of this late?
+            value = self.target_hostname
+        elif token == "%p":
+            value = config.get("port", SSH_PORT)
+        elif token == "%r":
+            value = config["user"] if "user" in config else self["%u"]
+        elif token == "%u":
+            value = getpass.getuser()
+        else:
+            raise KeyError(token)
+        value = self[token] = str(value)
+        return value
+
+
 class LazyFqdn(object):
     """
     Returns the host's fqdn on request as string.
@@ -4,7 +4,7 @@
 from os.path import expanduser
 from socket import gaierror
 
-from paramiko.py3compat import string_types
+from paramiko.py3compat import StringIO, string_types
 
 from invoke import Result
 from mock import patch
@@ -226,6 +226,82 @@ Host explicit_host
         # Remote user falls back to local user; host and orighost may differ
         assert result == "remoteuser gandalf host ohai orighost explicit_host"
 
+    @patch("paramiko.config.getpass")
+    def test_token_free_values_skip_tokenization(self, getpass, socket):
+        config = SSHConfig.from_text(
+            """
+Host *
+    ProxyCommand nc proxy 22
+    IdentityFile id_rsa
+"""
+        )
+        result = config.lookup("whatever")
+        assert result["proxycommand"] == "nc proxy 22"
+        assert result["identityfile"] == ["id_rsa"]
+        assert not getpass.getuser.called
+        assert not socket.gethostname.called
+
+    @mark.parametrize(
+        "host,port",
+        (
+            ("exact.example.com", "1"),
+            ("prefix.example.org", "2"),
+            ("www.suffix.net", "3"),
+            ("an-infix-host", "4"),
+            ("glob7.example.io", "5"),
+            ("nothing.matches", "6"),
+        ),
+    )
+    def test_host_pattern_kinds(self, host, port):
+        config = SSHConfig.from_text(
+            """
+Host exact.example.com
+    Port 1
+
+Host prefix.*
+    Port 2
+
+Host *.suffix.net
+    Port 3
+
+Host *infix*
+    Port 4
+
+Host glob?.*.io
+    Port 5
+
+Host *
+    Port 6
+"""
+        )
+        assert config.lookup(host)["port"] == port
+
+    def test_host_patterns_have_no_bracket_expressions(self):
+        config = SSHConfig.from_text(
+            """
+Host web[12]*
+    Port 1
+"""
+        )
+        assert config.lookup("web[12].example.com")["port"] == "1"
+        assert "port" not in config.lookup("web1.example.com")
+
+    def test_host_matching_is_case_insensitive(self):
+        config = SSHConfig.from_text(
+            """
+Host Exact.Example.COM
+    Port 1
+
+Host *.EXAMPLE.org
+    Port 2
+"""
+        )
+        assert config.lookup("exact.example.com")["port"] == "1"
+        result = config.lookup("WWW.example.ORG")
+        assert result["port"] == "2"
+        # Original spelling is still what gets handed back
+        assert result["hostname"] == "WWW.example.ORG"
+
     def test_negation(self):
         config = SSHConfig.from_text(
             """
@@ -306,6 +382,44 @@ IdentityFile id_dsa22
 
             assert config.lookup(host) == values
 
+    def test_identityfile_repeats_from_later_blocks_are_dropped(self):
+        config = SSHConfig.from_text(
+            """
+Host foo
+    IdentityFile id_a
+
+Host *
+    IdentityFile id_b
+    IdentityFile id_b
+"""
+        )
+        assert config.lookup("foo")["identityfile"] == ["id_a", "id_b"]
+
+    def test_lookup_does_not_modify_parsed_config(self):
+        config = SSHConfig.from_text(
+            """
+Host *
+    IdentityFile ~/id_one
+
+Host two
+    IdentityFile ~/id_two
+    LocalForward 8080 localhost:80
+"""
+        )
+        result = config.lookup("two")
+        assert result["identityfile"] == [
+            expanduser("~/id_one"),
+            expanduser("~/id_two"),
+        ]
+        assert config._config[1]["config"]["identityfile"] == ["~/id_one"]
+        assert config._config[2]["config"] == {
+            "identityfile": ["~/id_two"],
+            "localforward": ["8080 localhost:80"],
+        }
+        assert result["localforward"] is not (
+            config._config[2]["config"]["localforward"]
+        )
+
     def test_config_addressfamily_and_lazy_fqdn(self):
         """
         Ensure the code path honoring non-'all' AddressFamily doesn't asplode
@@ -320,6 +434,20 @@ IdentityFile something_%l_using_fqdn
             "meh"
         )  # will die during lookup() if bug regresses
 
+    def test_fqdn_only_resolved_when_used(self, socket):
+        config = SSHConfig.from_text(
+            """
+Host *
+    IdentityFile ~/.ssh/id_%h
+    ControlPath ~/.ssh/%r@%h:%p
+"""
+        )
+        result = config.lookup("meh")
+        assert result["identityfile"] == [expanduser("~/.ssh/id_meh")]
+        assert not socket.gethostname.called
+        assert not socket.getfqdn.called
+        assert not socket.getaddrinfo.called
+
     def test_config_dos_crlf_succeeds(self):
         config = SSHConfig.from_text(
             """
@@ -328,10 +456,31 @@ Host abcqwerty\r\nHostName 127.0.0.1\r\n
         )
         assert config.lookup("abcqwerty")["hostname"] == "127.0.0.1"
 
+    def test_config_mixed_line_endings(self):
+        config = SSHConfig.from_text(
+            "# comment\r\nHost abc \r\n  User  foo\t\r\nHost *\n  Port 23\r\n"
+        )
+        assert config.lookup("abc") == {
+            "hostname": "abc",
+            "user": "foo",
+            "port": "23",
+        }
+
+    @mark.parametrize("separator", (u"\x0c", u"\u2028"))
+    def test_comments_only_end_at_newlines(self, separator):
+        config = SSHConfig.from_text(
+            u"# note{}User evil\nHost a\n  Port 1\n".format(separator)
+        )
+        assert config._config[0] == {"host": ["*"], "config": {}}
+        assert "user" not in config.lookup("a")
+
     def test_get_hostnames(self):
         expected = {"*", "*.example.com", "spoo.example.com"}
         assert self.config.get_hostnames() == expected
 
+    def test_get_hostnames_ignores_match_blocks(self):
+        assert load_config("match-host").get_hostnames() == {"*"}
+
     def test_quoted_host_names(self):
         config = SSHConfig.from_text(
             """
@@ -409,6 +558,11 @@ Host param3 parara
             '"pa ram"': ["pa ram"],
             '"pa ram" pam': ["pa ram", "pam"],
             'param "p a m"': ["param", "p a m"],
+            'pa"ra"m': ["param"],
+            "'pa ram' pam": ["pa ram", "pam"],
+            'param \\"pam\\"': ["param", '"pam"'],
+            'b\x0c"#"': ["b\x0c#"],
+            "a\xa0b c": ["a\xa0b", "c"],
         }
         incorrect_data = ['param"', '"param', 'param "pam', 'param "pam" "p a']
         for host, values in correct_data.items():
@@ -421,6 +575,20 @@ Host param3 parara
         with raises(ConfigParseError):
             load_config("invalid")
 
+    def test_repeated_lookups_are_independent(self):
+        first = self.config.lookup("spoo.example.com")
+        first["identityfile"].append("mutated")
+        first["user"] = "mutated"
+        second = self.config.lookup("spoo.example.com")
+        assert second["identityfile"] == [expanduser("~/.ssh/id_rsa")]
+        assert second["user"] == "robey"
+
+    def test_parse_invalidates_previous_lookups(self):
+        config = SSHConfig.from_text("Host foo\n    Port 1\n")
+        assert config.lookup("foo")["port"] == "1"
+        config.parse(StringIO("Host *\n    User bar\n"))
+        assert config.lookup("foo")["user"] == "bar"
+
     def test_proxycommand_none_issue_418(self):
         config = SSHConfig.from_text(
             """
@@ -815,6 +983,10 @@ class TestMatchHost(object):
         assert conf.lookup("good")["user"] == "perrin"
         assert "user" not in conf.lookup("goof")
 
+    def test_is_case_insensitive(self):
+        config = SSHConfig.from_text("Match host Some*\n    User thom\n")
+        assert config.lookup("someHOST")["user"] == "thom"
+
     def test_matches_canonicalized_name(self, socket):
         # Without 'canonical' explicitly declared, mind.
         result = load_config("match-host-canonicalized").lookup("www")